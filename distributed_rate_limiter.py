@@ -1,51 +1,301 @@
+import asyncio
+import logging
+import os
+import random
 import redis
-import uuid
 import time
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# Warn when client and Redis wall clocks disagree by more than this.
+CLOCK_SKEW_WARN_SECONDS = 5.0
+
+# Max entries in the per-process deny cache (see RedisRateLimiter.allow)
+DENY_CACHE_MAX_ENTRIES = 4096
 
 REDIS_RATE_LIMIT_SCRIPT = """
 -- Redis Lua script for atomic rate limit check
 -- Executes all operations as a single atomic transaction
 
-local key = KEYS[1]                    -- e.g., "ratelimit:user123:gpt4"
-local now = tonumber(ARGV[1])          -- Current Unix timestamp
-local window_seconds = tonumber(ARGV[2]) -- e.g., 3600
+-- Effects replication: these scripts use a client-supplied timestamp,
+-- so they are non-deterministic. Replicate the resulting commands, not
+-- the script, so replicas/AOF never re-run it with different inputs.
+-- (Default since Redis 5.0; explicit for mixed-version clusters.)
+redis.replicate_commands()
+
+local key = KEYS[1]                    -- e.g., "rl:{user123}:gpt4"
+local now = tonumber(ARGV[1])          -- Unix time, integer milliseconds
+local window_ms = tonumber(ARGV[2])    -- Window length, milliseconds
 local max_requests = tonumber(ARGV[3])  -- e.g., 100
-local request_id = ARGV[4]             -- Unique request identifier
+local request_id = ARGV[4]             -- Unique request identifier (opaque
+                                       -- string or raw bytes; 16 raw bytes
+                                       -- when auto-generated client-side)
 
--- Compute window boundaries
-local window_start = now - window_seconds
+-- Idempotency: a retry carrying a request_id we already counted is a
+-- no-op. One O(log N) lookup short-circuits the trim/count/add/expire
+-- sequence below and guarantees retries never double-consume quota.
+if redis.call('ZSCORE', key, request_id) then
+    return 1
+end
+
+-- Compute window boundaries (scores are millisecond timestamps)
+local window_start = now - window_ms
 
 -- Step 1: Remove all requests outside the current window
 -- ZREMRANGEBYSCORE removes by score range (timestamps)
 redis.call('ZREMRANGEBYSCORE', key, '-inf', window_start)
 
--- Step 2: Count requests in current window
--- ZCARD returns the number of members in the sorted set
-local current_count = redis.call('ZCARD', key)
-
--- Step 3: Check if we can allow this request
-if current_count < max_requests then
-    -- Allow: add this request to the sorted set
-    -- Score is the timestamp, member is the unique request ID
-    redis.call('ZADD', key, now, request_id)
-    
-    -- Set key expiration to avoid unbounded growth
-    -- After window_seconds, the key automatically expires
-    redis.call('EXPIRE', key, window_seconds + 60)  -- +60 for safety margin
-    
-    -- Return 1 (allowed)
-    return 1
-else
-    -- Deny: rate limit exceeded
+-- Step 2: Add first, then count. ZADD followed by ZCARD touches the
+-- same skiplist node while it is cache-hot; on the allow path this is
+-- one fewer branch than count-then-add, at the cost of a retroactive
+-- ZREM on the (rare) deny path.
+redis.call('ZADD', key, now, request_id)
+local count = redis.call('ZCARD', key)
+
+if count > max_requests then
+    -- Deny: roll back our own entry so it doesn't occupy the window
+    redis.call('ZREM', key, request_id)
+    return 0
+end
+
+-- Set key expiration to avoid unbounded growth, but only when the TTL
+-- actually needs refreshing (new key, or remaining TTL shorter than the
+-- window). PTTL is O(1) and read-only, so hot keys skip the redundant
+-- EXPIRE write and the AOF/replication traffic it generates.
+local ttl = redis.call('PTTL', key)
+if ttl < 0 or ttl < window_ms then
+    redis.call('PEXPIRE', key, window_ms + 60000)  -- +60s safety margin
+end
+
+-- Return 1 (allowed)
+return 1
+"""
+
+
+REDIS_RATE_LIMIT_BATCH_SCRIPT = """
+-- Batched variant of the rate limit check for request coalescing.
+-- ARGV[1..3] are now/window/max as in the single script; ARGV[4..N] are
+-- request IDs for the same key. Returns a table of 0/1 per ID.
+
+-- Effects replication: these scripts use a client-supplied timestamp,
+-- so they are non-deterministic. Replicate the resulting commands, not
+-- the script, so replicas/AOF never re-run it with different inputs.
+-- (Default since Redis 5.0; explicit for mixed-version clusters.)
+redis.replicate_commands()
+
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2])
+local max_requests = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window_ms)
+local count = redis.call('ZCARD', key)
+
+-- Admit in arrival order, collecting accepted IDs into one variadic
+-- ZADD: Redis handles a multi-member ZADD far faster than N singles.
+local results = {}
+local zadd_args = {}
+for i = 4, #ARGV do
+    if count < max_requests then
+        count = count + 1
+        zadd_args[#zadd_args + 1] = now
+        zadd_args[#zadd_args + 1] = ARGV[i]
+        results[i - 3] = 1
+    else
+        results[i - 3] = 0
+    end
+end
+
+if #zadd_args > 0 then
+    redis.call('ZADD', key, unpack(zadd_args))
+    local ttl = redis.call('PTTL', key)
+    if ttl < 0 or ttl < window_ms then
+        redis.call('PEXPIRE', key, window_ms + 60000)
+    end
+end
+
+return results
+"""
+
+
+REDIS_MULTI_LIMIT_SCRIPT = """
+-- Check several sliding-window limits for one user in a single atomic
+-- call. All KEYS share the user's {hash-tag}, so on Redis Cluster they
+-- live in one slot and the script runs on one node -- this is what
+-- replaces client-side consistent hashing for sharded deployments.
+--
+-- KEYS[i]  = i-th limit key
+-- ARGV[1]  = now, integer milliseconds
+-- ARGV[2]  = request_id (shared across limits for idempotency)
+-- ARGV[2i+1], ARGV[2i+2] = window_ms, max_requests for KEYS[i]
+--
+-- Two-phase: verify every limit has headroom, then record against all
+-- of them. Nothing is written unless every limit passes, so a deny in
+-- one dimension never consumes quota in another.
+-- Returns 0 if allowed, else the 1-based index of the denying limit.
+
+-- Effects replication: these scripts use a client-supplied timestamp,
+-- so they are non-deterministic. Replicate the resulting commands, not
+-- the script, so replicas/AOF never re-run it with different inputs.
+-- (Default since Redis 5.0; explicit for mixed-version clusters.)
+redis.replicate_commands()
+
+local now = tonumber(ARGV[1])
+local request_id = ARGV[2]
+
+for i = 1, #KEYS do
+    -- Retries that already recorded against this key pass trivially
+    if not redis.call('ZSCORE', KEYS[i], request_id) then
+        local window_ms = tonumber(ARGV[2 * i + 1])
+        local max_requests = tonumber(ARGV[2 * i + 2])
+        redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now - window_ms)
+        if redis.call('ZCARD', KEYS[i]) >= max_requests then
+            return i
+        end
+    end
+end
+
+for i = 1, #KEYS do
+    local window_ms = tonumber(ARGV[2 * i + 1])
+    -- NX: a retried request_id keeps its original timestamp; refreshing
+    -- it to `now` would let endless retries hold the entry in the
+    -- window forever (same bug the single-key script's guard prevents)
+    redis.call('ZADD', KEYS[i], 'NX', now, request_id)
+    local ttl = redis.call('PTTL', KEYS[i])
+    if ttl < 0 or ttl < window_ms then
+        redis.call('PEXPIRE', KEYS[i], window_ms + 60000)
+    end
+end
+
+return 0
+"""
+
+
+REDIS_TOKEN_BUCKET_SCRIPT = """
+-- Token bucket rate limit check, atomic in Lua.
+-- State per key is a 2-field HASH {t: tokens, ts: last refill ms} --
+-- O(1) memory regardless of max_requests, versus one ZSET entry per
+-- request for the sliding window log.
+
+-- Effects replication: these scripts use a client-supplied timestamp,
+-- so they are non-deterministic. Replicate the resulting commands, not
+-- the script, so replicas/AOF never re-run it with different inputs.
+-- (Default since Redis 5.0; explicit for mixed-version clusters.)
+redis.replicate_commands()
+
+local key = KEYS[1]
+local now_ms = tonumber(ARGV[1])       -- Unix time, integer milliseconds
+local refill_ms = tonumber(ARGV[2])    -- Time to refill a full bucket
+local capacity = tonumber(ARGV[3])     -- Bucket size (max burst)
+
+local data = redis.call('HMGET', key, 't', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local last = tonumber(data[2]) or now_ms
+
+-- Continuous refill: capacity tokens per refill_ms, capped at capacity
+local refilled = math.min(
+    capacity, tokens + (now_ms - last) * capacity / refill_ms
+)
+
+if refilled < 1 then
     return 0
 end
+
+redis.call('HMSET', key, 't', refilled - 1, 'ts', now_ms)
+redis.call('PEXPIRE', key, refill_ms + 60000)
+return 1
 """
 
 
+REDIS_WINDOW_COUNTER_SCRIPT = """
+-- Bucketed sliding-window counter, atomic in Lua.
+-- Instead of one ZSET member per request, the key is a HASH of
+-- sub-window buckets (bucket start ms -> count). Memory per key is
+-- O(window / bucket) regardless of max_requests -- at max_requests in
+-- the thousands this is orders of magnitude smaller than the log --
+-- at the cost of admission accuracy bounded by one bucket length.
+
+-- Effects replication: these scripts use a client-supplied timestamp,
+-- so they are non-deterministic. Replicate the resulting commands, not
+-- the script, so replicas/AOF never re-run it with different inputs.
+-- (Default since Redis 5.0; explicit for mixed-version clusters.)
+redis.replicate_commands()
+
+local key = KEYS[1]
+local now = tonumber(ARGV[1])          -- Unix time, integer milliseconds
+local window_ms = tonumber(ARGV[2])
+local max_requests = tonumber(ARGV[3])
+local bucket_ms = tonumber(ARGV[4])
+
+local cutoff = now - window_ms
+
+-- Sum live buckets, evicting expired ones as we pass them. The field
+-- count is bounded by window/bucket (e.g. 60 for 1s buckets over 60s),
+-- not by request volume.
+local sum = 0
+local fields = redis.call('HGETALL', key)
+for i = 1, #fields, 2 do
+    local ts = tonumber(fields[i])
+    if ts <= cutoff then
+        redis.call('HDEL', key, fields[i])
+    else
+        sum = sum + tonumber(fields[i + 1])
+    end
+end
+
+if sum >= max_requests then
+    return 0
+end
+
+redis.call('HINCRBY', key, now - (now % bucket_ms), 1)
+local ttl = redis.call('PTTL', key)
+if ttl < 0 or ttl < window_ms then
+    redis.call('PEXPIRE', key, window_ms + 60000)
+end
+return 1
+"""
+
+
+@lru_cache(maxsize=65536)
+def _make_key(user_id: str, model_id: str) -> bytes:
+    """
+    Build the Redis key for a user-model pair, memoized.
+
+    Real workloads repeat a small set of (user, model) pairs, so the
+    f-string formatting and UTF-8 encoding are paid once per pair
+    instead of on every allow() call. Bounded at 64k entries (~4MB worst
+    case); lru_cache is thread-safe.
+    """
+    return f"rl:{{{user_id}}}:{model_id}".encode("utf-8")
+
+
+def _scan_iter_batched(redis_client, pattern, count=500):
+    """
+    Iterate keys matching pattern via SCAN, yielding lists of up to
+    `count` keys. SCAN is non-blocking (cursor-based), unlike KEYS.
+    """
+    cursor = 0
+    while True:
+        cursor, keys = redis_client.scan(
+            cursor=cursor, match=pattern, count=count
+        )
+        if keys:
+            yield keys
+        if cursor == 0:
+            break
+
+
 class RedisRateLimiter:
     """
     Distributed Redis-backed rate limiter using Sliding Window Log algorithm.
 
+    Keys use the form "rl:{user_id}:model_id". The braces are a Redis
+    Cluster hash-tag: only the user_id is hashed for slot assignment, so
+    every model key for a given user lives on the same cluster node.
+
     Dependencies:
         # Start your Redis server locally for testing:
         import redis
@@ -63,25 +313,81 @@ class RedisRateLimiter:
             return Response(status=429, reason="Rate limited")
     """
 
-    def __init__(self, redis_client):
+    ALGORITHM_SCRIPTS = {
+        "sliding_window": REDIS_RATE_LIMIT_SCRIPT,
+        "token_bucket": REDIS_TOKEN_BUCKET_SCRIPT,
+        "window_counter": REDIS_WINDOW_COUNTER_SCRIPT,
+    }
+
+    def __init__(
+        self,
+        redis_client,
+        algorithm: str = "sliding_window",
+        bucket_seconds: int = 60,
+    ):
         """
         Initialize Redis-based rate limiter.
 
         Args:
             redis_client: redis.Redis or redis.cluster.RedisCluster instance
+            algorithm: "sliding_window" (exact, O(max_requests) memory
+                per key), "token_bucket" (approximate burst control,
+                O(1) memory per key -- two small hash fields instead of
+                one ZSET entry per request), or "window_counter"
+                (sliding window approximated by sub-window buckets,
+                O(window/bucket) memory per key -- the right choice for
+                large max_requests). Only sliding_window supports
+                request_id idempotency and get_request_count.
+            bucket_seconds: Sub-window bucket size for window_counter;
+                admission accuracy is bounded by one bucket length
         """
+        if algorithm not in self.ALGORITHM_SCRIPTS:
+            raise ValueError(f"Unknown algorithm: {algorithm!r}")
+
         self.redis = redis_client
-        self.script_sha = redis_client.script_load(
-            REDIS_RATE_LIMIT_SCRIPT
+        self.algorithm = algorithm
+        self.bucket_seconds = bucket_seconds
+        # Script handles EVALSHA-first with EVAL fallback internally,
+        # so we never manage the SHA or catch NoScriptError ourselves.
+        self._script = redis_client.register_script(
+            self.ALGORITHM_SCRIPTS[algorithm]
         )
 
+        self._multi_script = redis_client.register_script(
+            REDIS_MULTI_LIMIT_SCRIPT
+        )
+
+        # Script stores its SHA as a hex str and re-encodes it on every
+        # EVALSHA when building the RESP frame. Pre-encoding once makes
+        # the per-call sha argument a pass-through. (On a NOSCRIPT
+        # reload Script resets it to str, which stays correct, merely
+        # unoptimized until re-created.)
+        if isinstance(self._script.sha, str):
+            self._script.sha = self._script.sha.encode("ascii")
+        if isinstance(self._multi_script.sha, str):
+            self._multi_script.sha = self._multi_script.sha.encode("ascii")
+
+        # Pre-bound method for the hot path: one attribute lookup per
+        # call instead of client-then-method. Safe because the client is
+        # expected to be immutable for the limiter's lifetime.
+        self._evalsha = redis_client.evalsha
+
+        # Thundering-herd guard: once a key is denied, retries within the
+        # next quota-slot interval are denied locally without a Redis
+        # round-trip. Entries are keyed on (key, max_requests,
+        # window_seconds) so a deny under one limit never blocks calls
+        # made under a laxer one. LRU-bounded so hostile key churn
+        # can't grow it.
+        self._deny_cache = OrderedDict()  # cache key -> monotonic deadline
+        self._deny_cache_lock = Lock()
+
     def allow(
         self,
         user_id: str,
         model_id: str,
         max_requests: int = 100,
         window_seconds: int = 3600,
-        request_id: str = None,
+        request_id=None,
     ) -> bool:
         """
         Check if a request is allowed using Redis-backed rate limiting.
@@ -91,46 +397,208 @@ class RedisRateLimiter:
             model_id: Model identifier (e.g., "gpt-4", "llama-70b")
             max_requests: Maximum requests in window (default 100)
             window_seconds: Time window in seconds (default 3600)
-            request_id: Unique request ID (UUID).
-                    If None, generated automatically.
-                    Important: Same request_id for retries ensures idempotency.
+            request_id: Unique request ID (str or bytes, e.g. an
+                    X-Request-ID header value). If None, 16 random bytes
+                    are generated. Passing bytes avoids the UUID
+                    formatting cost and halves the ZSET member size.
+                    Important: Same request_id for retries ensures
+                    idempotency.
 
         Returns:
             True if request allowed, False if rate limited
 
         Raises:
             redis.RedisError: If Redis connection fails
-            redis.exceptions.NoScriptError:
-                If Lua script not loaded (retry will reload)
         """
 
+        # Hash-tagged key: Redis Cluster hashes only the {user_id} part,
+        # so all of a user's model keys land on the same slot and can be
+        # touched atomically by multi-key scripts. Memoized, so repeat
+        # callers skip the formatting and encoding entirely.
+        key = _make_key(user_id, model_id)
+
+        # Short-circuit keys we recently saw denied: during a burst from
+        # one user every retry would otherwise pay a full Redis RTT just
+        # to be denied again. The cached deadline is at most one average
+        # quota-slot interval away, so we never deny a request that
+        # Redis might have allowed by more than that margin. A
+        # caller-supplied request_id bypasses the cache entirely: it may
+        # be a retry of an already-recorded request, which the script's
+        # ZSCORE guard would idempotently allow -- denying it locally
+        # would break the retry contract.
+        now_mono = time.monotonic()
+        cache_key = (key, max_requests, window_seconds)
         if request_id is None:
-            request_id = str(uuid.uuid4())
-
-        key = f"ratelimit:{user_id}:{model_id}"
-        now = time.time()
-
-        try:
-            # Execute Lua script atomically on Redis
-            result = self.redis.evalsha(
-                sha=self.script_sha,
-                numkeys=1,
-                keys=[key],
-                args=[now, window_seconds, max_requests, request_id],
+            with self._deny_cache_lock:
+                deny_until = self._deny_cache.get(cache_key)
+                if deny_until is not None:
+                    if deny_until > now_mono:
+                        return False
+                    del self._deny_cache[cache_key]
+
+        # Integer milliseconds: shorter on the wire than a float repr and
+        # cheaper for Lua's tonumber, with sub-second precision kept.
+        now_ms = int(time.time() * 1000)
+
+        if self.algorithm == "token_bucket":
+            # Bucket of max_requests tokens refilling over the window;
+            # no per-request member, so request_id is unused.
+            args = [now_ms, window_seconds * 1000, max_requests]
+        elif self.algorithm == "window_counter":
+            args = [
+                now_ms,
+                window_seconds * 1000,
+                max_requests,
+                self.bucket_seconds * 1000,
+            ]
+        else:
+            if request_id is None:
+                # os.urandom is what uuid4 uses internally, minus the
+                # UUID object construction and version-bit fiddling.
+                # 16 random bytes keep collision odds negligible, and
+                # the Lua script treats the member as opaque anyway.
+                request_id = os.urandom(16)
+            args = [now_ms, window_seconds * 1000, max_requests, request_id]
+
+        # Roughly 1 in 1024 calls piggybacks a TIME command on the same
+        # round-trip to detect client/server clock skew without paying a
+        # second RTT on every request. getrandbits keeps the sampling
+        # unsynchronized across processes.
+        if random.getrandbits(10) == 0:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.time()
+            self._script(keys=[key], args=args, client=pipe)
+            redis_time, result = pipe.execute()
+            skew = abs(
+                redis_time[0] + redis_time[1] / 1e6 - now_ms / 1000.0
             )
+            if skew > CLOCK_SKEW_WARN_SECONDS:
+                logger.warning(
+                    "Clock skew of %.1fs between client and Redis; "
+                    "sliding windows may be inaccurate",
+                    skew,
+                )
+        else:
+            # Execute Lua script atomically on Redis via the pre-bound
+            # EVALSHA. If the script was flushed, fall back to Script,
+            # which re-EVALs and re-caches the SHA.
+            try:
+                result = self._evalsha(self._script.sha, 1, key, *args)
+            except redis.exceptions.NoScriptError:
+                result = self._script(
+                    keys=[key], args=args, client=self.redis
+                )
+
+        allowed = bool(result)
+        if not allowed:
+            # Cache the denial for one average quota-slot interval,
+            # capped at a second so recovery is never far off.
+            slot = window_seconds / max_requests if max_requests else 1.0
+            ttl = min(1.0, max(0.01, slot))
+            with self._deny_cache_lock:
+                self._deny_cache[cache_key] = now_mono + ttl
+                self._deny_cache.move_to_end(cache_key)
+                if len(self._deny_cache) > DENY_CACHE_MAX_ENTRIES:
+                    self._deny_cache.popitem(last=False)
 
-            return bool(result)
+        return allowed
 
-        except redis.exceptions.NoScriptError:
-            # Script was flushed from Redis, reload and retry
-            self.script_sha = self.redis.script_load(REDIS_RATE_LIMIT_SCRIPT)
-            result = self.redis.evalsha(
-                sha=self.script_sha,
-                numkeys=1,
-                keys=[key],
-                args=[now, window_seconds, max_requests, request_id],
+    def allow_many(
+        self,
+        items,
+        max_requests: int = 100,
+        window_seconds: int = 3600,
+    ) -> list:
+        """
+        Check many user-model pairs in a single pipelined round-trip.
+
+        Gateways that receive a batch of requests per tick would pay one
+        Redis RTT per allow() call; a non-transactional pipeline sends
+        all script invocations in one TCP write and reads all replies in
+        one read, amortizing the round-trip across the batch. Each key
+        is still checked atomically by its own script execution.
+
+        Args:
+            items: Iterable of (user_id, model_id) or
+                (user_id, model_id, request_id) tuples
+            max_requests: Maximum requests in window (default 100)
+            window_seconds: Time window in seconds (default 3600)
+
+        Returns:
+            List of booleans in input order, True where allowed
+        """
+        now_ms = int(time.time() * 1000)
+        pipe = self.redis.pipeline(transaction=False)
+
+        for item in items:
+            user_id, model_id = item[0], item[1]
+            request_id = item[2] if len(item) > 2 else None
+            key = _make_key(user_id, model_id)
+
+            if self.algorithm == "token_bucket":
+                args = [now_ms, window_seconds * 1000, max_requests]
+            elif self.algorithm == "window_counter":
+                args = [
+                    now_ms,
+                    window_seconds * 1000,
+                    max_requests,
+                    self.bucket_seconds * 1000,
+                ]
+            else:
+                if request_id is None:
+                    request_id = os.urandom(16)
+                args = [now_ms, window_seconds * 1000, max_requests, request_id]
+
+            self._script(keys=[key], args=args, client=pipe)
+
+        return [bool(result) for result in pipe.execute()]
+
+    def allow_multi_model(
+        self, user_id: str, model_checks, request_id=None
+    ):
+        """
+        Atomically check several per-model limits for one user.
+
+        Because keys are hash-tagged on user_id, all of a user's model
+        keys share a cluster slot, so one script call can enforce e.g.
+        a per-model limit plus an hourly all-models total in a single
+        round-trip instead of one RTT per limit. No quota is consumed
+        anywhere unless every limit passes, so a deny in one dimension
+        never eats into another.
+
+        Args:
+            user_id: Unique user identifier
+            model_checks: List of (model_id, max_requests,
+                window_seconds) tuples, one per limit to enforce
+            request_id: Shared unique request ID (str or bytes).
+                    If None, 16 random bytes are generated.
+
+        Returns:
+            (allowed: bool, denied_model: str or None) -- when denied,
+            the model_id of the first limit that rejected the request
+
+        Raises:
+            ValueError: If the limiter uses the token_bucket algorithm
+        """
+        if self.algorithm != "sliding_window":
+            raise ValueError(
+                "allow_multi_model requires the sliding_window algorithm"
             )
-            return bool(result)
+
+        if request_id is None:
+            request_id = os.urandom(16)
+
+        keys = [
+            _make_key(user_id, model_id) for model_id, _, _ in model_checks
+        ]
+        args = [int(time.time() * 1000), request_id]
+        for _, max_requests, window_seconds in model_checks:
+            args.extend((window_seconds * 1000, max_requests))
+
+        result = self._multi_script(keys=keys, args=args, client=self.redis)
+        if result:
+            return False, model_checks[result - 1][0]
+        return True, None
 
     def get_request_count(
         self, user_id: str, model_id: str, window_seconds: int = 3600
@@ -146,13 +614,18 @@ class RedisRateLimiter:
         Returns:
             Current number of requests in the window
         """
-        key = f"ratelimit:{user_id}:{model_id}"
-        now = time.time()
-        window_start = now - window_seconds
+        key = _make_key(user_id, model_id)
+        now_ms = int(time.time() * 1000)
+        window_start = now_ms - window_seconds * 1000
 
-        # Count requests in current window
-        # Note: This reads the live key, doesn't clean it
-        count = self.redis.zcount(key, min=window_start, max=now)
+        # Trim expired entries, then take the O(1) cardinality, in one
+        # pipelined round-trip. ZCOUNT over the window range walks the
+        # skiplist on every poll; trim+ZCARD bounds the work to entries
+        # that actually expired since the last touch.
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(key, "-inf", window_start)
+        pipe.zcard(key)
+        _, count = pipe.execute()
         return count
 
     def reset_user(self, user_id: str, model_id: str = None) -> int:
@@ -168,12 +641,153 @@ class RedisRateLimiter:
             Number of keys deleted
         """
         if model_id:
-            key = f"ratelimit:{user_id}:{model_id}"
-            return self.redis.delete(key)
+            key = _make_key(user_id, model_id)
+            return self.redis.unlink(key)
         else:
-            # Delete all keys matching pattern
-            pattern = f"ratelimit:{user_id}:*"
-            keys = self.redis.keys(pattern)
-            if keys:
-                return self.redis.delete(*keys)
-            return 0
+            # SCAN instead of KEYS: KEYS walks the whole keyspace in one
+            # blocking call, stalling Redis on large deployments. SCAN is
+            # cursor-based and interleaves with other commands, and
+            # UNLINK frees memory in a background thread instead of
+            # inline like DEL.
+            pattern = f"rl:{{{user_id}}}:*"
+            deleted = 0
+            for batch in _scan_iter_batched(self.redis, pattern, count=500):
+                if batch:
+                    deleted += self.redis.unlink(*batch)
+            return deleted
+
+
+class AsyncRedisRateLimiter:
+    """
+    Async variant of RedisRateLimiter for asyncio servers (e.g. FastAPI).
+
+    A plain `await limiter.allow(...)` frees the event loop during the
+    Redis round-trip instead of blocking a worker. For hot keys there is
+    also a coalescing mode: concurrent `allow_coalesced()` calls for the
+    same user-model key within a short window (default 1ms) are batched
+    into a single Lua script call, amortizing one round-trip across the
+    whole batch.
+
+    Usage:
+        import redis.asyncio
+
+        limiter = AsyncRedisRateLimiter(
+            redis.asyncio.Redis(host="localhost", port=6379)
+        )
+
+        if not await limiter.allow("user123", "gpt-4"):
+            return Response(status=429, reason="Rate limited")
+    """
+
+    def __init__(self, redis_client, coalesce_window_ms: float = 1.0):
+        """
+        Initialize async Redis-based rate limiter.
+
+        Args:
+            redis_client: redis.asyncio.Redis instance
+            coalesce_window_ms: How long allow_coalesced() waits to
+                collect concurrent same-key requests into one batch
+        """
+        self.redis = redis_client
+        self._script = redis_client.register_script(REDIS_RATE_LIMIT_SCRIPT)
+        self._batch_script = redis_client.register_script(
+            REDIS_RATE_LIMIT_BATCH_SCRIPT
+        )
+        self.coalesce_window_ms = coalesce_window_ms
+
+        # key -> list of (request_id, Future) awaiting the next drain
+        self._pending = {}
+        # key -> (max_requests, window_seconds) for the pending batch.
+        # Last writer wins: if concurrent same-key calls pass different
+        # limits, the whole batch is judged under the limits of the
+        # call that arrived last. Coalescing assumes a key has one
+        # configured limit; pass differing limits via allow() instead.
+        self._params = {}
+        self._drain_task = None
+
+    async def allow(
+        self,
+        user_id: str,
+        model_id: str,
+        max_requests: int = 100,
+        window_seconds: int = 3600,
+        request_id=None,
+    ) -> bool:
+        """
+        Check if a request is allowed. Same semantics as the sync
+        RedisRateLimiter.allow, but awaitable.
+        """
+        if request_id is None:
+            request_id = os.urandom(16)
+
+        key = _make_key(user_id, model_id)
+        now_ms = int(time.time() * 1000)
+
+        result = await self._script(
+            keys=[key],
+            args=[now_ms, window_seconds * 1000, max_requests, request_id],
+            client=self.redis,
+        )
+        return bool(result)
+
+    async def allow_coalesced(
+        self,
+        user_id: str,
+        model_id: str,
+        max_requests: int = 100,
+        window_seconds: int = 3600,
+        request_id=None,
+    ) -> bool:
+        """
+        Check if a request is allowed, batching with concurrent calls.
+
+        Calls for the same key arriving within coalesce_window_ms share
+        one round-trip via the batch script. Adds up to one coalescing
+        window of latency, so use this for throughput-bound hot keys.
+        """
+        if request_id is None:
+            request_id = os.urandom(16)
+
+        key = _make_key(user_id, model_id)
+        future = asyncio.get_running_loop().create_future()
+
+        self._pending.setdefault(key, []).append((request_id, future))
+        self._params[key] = (max_requests, window_seconds)
+
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
+
+        return await future
+
+    async def _drain(self):
+        """Flush all pending batches after one coalescing window."""
+        await asyncio.sleep(self.coalesce_window_ms / 1000.0)
+
+        pending, self._pending = self._pending, {}
+        params, self._params = self._params, {}
+        now_ms = int(time.time() * 1000)
+
+        for key, entries in pending.items():
+            max_requests, window_seconds = params[key]
+            args = [now_ms, window_seconds * 1000, max_requests]
+            args.extend(rid for rid, _ in entries)
+
+            try:
+                results = await self._batch_script(
+                    keys=[key], args=args, client=self.redis
+                )
+            except Exception as exc:
+                for _, future in entries:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            for (_, future), result in zip(entries, results):
+                if not future.done():
+                    future.set_result(bool(result))
+
+        # Calls that arrived while the batches above were in flight see
+        # the current task as not done and schedule nothing -- without
+        # this handoff their futures would never resolve.
+        if self._pending:
+            self._drain_task = asyncio.create_task(self._drain())
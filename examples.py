@@ -1,9 +1,79 @@
+import time
 import uuid
 from enum import Enum
+from threading import Lock
 from rate_limiter import RateLimiter
 from fastapi import FastAPI, HTTPException, Header
 
 
+class TokenBucketLimiter:
+    """
+    In-process token-budget limiter for AI inference (counts model
+    tokens, not requests).
+
+    Built for concurrency: a single global lock would serialize every
+    request across all users, so locks are striped 32 ways by key hash
+    and only ~3% of distinct users ever contend on the same lock.
+    Per-user state is a mutable [tokens, last_refill] list that is
+    updated in place (no tuple reallocation per request), and __slots__
+    keeps the limiter object itself compact.
+    """
+
+    __slots__ = ("max_tokens", "refill_seconds", "_state", "_locks")
+
+    _NUM_LOCKS = 32  # power of two so `hash & (n - 1)` picks the stripe
+
+    def __init__(self, max_tokens: int, refill_seconds: int = 3600):
+        """
+        Args:
+            max_tokens: Token budget per user-model pair (bucket size)
+            refill_seconds: Time to refill an empty bucket (default 1h)
+        """
+        self.max_tokens = max_tokens
+        self.refill_seconds = refill_seconds
+        self._state = {}  # key -> [tokens, last_refill] (mutable)
+        self._locks = [Lock() for _ in range(self._NUM_LOCKS)]
+
+    def allow(
+        self,
+        user_id: str,
+        model_id: str,
+        input_tokens: int,
+        output_tokens: int,
+    ) -> bool:
+        """
+        Check if a request costing input+output tokens fits the budget.
+
+        Returns:
+            True if the tokens were deducted, False if over budget
+        """
+        key = f"{user_id}:{model_id}"
+        cost = input_tokens + output_tokens
+        lock = self._locks[hash(key) & (self._NUM_LOCKS - 1)]
+
+        with lock:
+            now = time.monotonic()
+            state = self._state.get(key)
+            if state is None:
+                state = [float(self.max_tokens), now]
+                self._state[key] = state
+
+            # Continuous refill since last touch, capped at bucket size
+            tokens = min(
+                self.max_tokens,
+                state[0]
+                + (now - state[1]) * self.max_tokens / self.refill_seconds,
+            )
+            state[1] = now
+
+            if tokens < cost:
+                state[0] = tokens
+                return False
+
+            state[0] = tokens - cost
+            return True
+
+
 def example_basic_usage():
     """Simple usage of the in-memory rate limiter."""
     limiter = RateLimiter(max_requests=100, window_seconds=3600)
@@ -98,6 +168,16 @@ def example_multi_tier_usage():
     print(check_rate_limit("api-user-456", UserTier.FREE, "gpt-4"))
 
 
+def example_token_budget_usage():
+    """Budget model tokens (not request counts) per user."""
+    limiter = TokenBucketLimiter(max_tokens=10000, refill_seconds=3600)
+
+    if limiter.allow("user123", "gpt-4", input_tokens=500, output_tokens=1500):
+        print("✓ Request within token budget")
+    else:
+        print("✗ Token budget exhausted, return 429")
+
+
 if __name__ == "__main__":
 
     print("\n[Example 1: Basic Usage]")
@@ -108,3 +188,6 @@ if __name__ == "__main__":
 
     print("\n[Example 3: Multi-Tier Rate Limiting]")
     example_multi_tier_usage()
+
+    print("\n[Example 4: Token Budget Limiting]")
+    example_token_budget_usage()
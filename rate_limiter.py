@@ -1,9 +1,11 @@
-from typing import Dict, Tuple, List, Optional
-from threading import Lock
+from typing import Dict, List, Tuple, Optional
+from threading import Lock, Thread
 from collections import defaultdict
 import time
 from dataclasses import dataclass
 
+import numpy as np
+
 
 @dataclass
 class RateLimitConfig:
@@ -17,44 +19,188 @@ class SlidingWindowEntry:
     """
     Stores request timestamps within a sliding window for user-model pair.
 
-    Uses a list-based implementation for simplicity. In production with higher
-    throughput, could use collections.deque or a circular buffer.
+    Timestamps live in a preallocated NumPy float64 ring buffer with
+    monotonically increasing head/tail counters: 8 bytes per entry in
+    one contiguous block (a Python list of floats costs ~8x that in
+    boxed objects), zero allocations in steady state, and expiry finds
+    the cutoff with np.searchsorted -- a C-level binary search. With
+    max_entries set, the buffer is sized exactly to the cap and
+    appending at capacity evicts the oldest live entry in O(1), so the
+    admit path needs no expiry pass at all; unbounded entries grow by
+    doubling.
     """
 
-    def __init__(self, window_seconds: int):
+    # Starting capacity when no max_entries bound is given
+    _INITIAL_CAPACITY = 64
+
+    def __init__(self, window_seconds: int, max_entries: Optional[int] = None):
         self.window_seconds = window_seconds
-        self.timestamps: List[float] = []  # Sorted list of request times
+        self.max_entries = max_entries
+        self._capacity = max(max_entries, 1) if max_entries is not None \
+            else self._INITIAL_CAPACITY
+        self._buffer = np.empty(self._capacity, dtype=np.float64)
+        # Logical counters; physical slot is index % capacity
+        self._head = 0  # Oldest live timestamp
+        self._tail = 0  # One past the newest timestamp
+        # Guards the buffer; living on the entry keeps lock and data in
+        # one object and one dict lookup, and both are reclaimed
+        # together when the entry is deleted. threading.Lock IS the C
+        # primitive (_thread.allocate_lock is an alias, not a wrapper),
+        # so there is no cheaper lock to swap in; the critical section
+        # itself is multiple bytecodes, so the lock cannot be dropped
+        # in favor of GIL atomicity either.
+        self.lock = Lock()
+        # Updated by the limiter on every hit; read by the idle-key
+        # sweeper to decide whether an empty entry can be evicted.
+        self.last_access = 0.0
+
+    def _grow(self) -> None:
+        """Double the buffer, unwrapping live entries to the front."""
+        new_buffer = np.empty(self._capacity * 2, dtype=np.float64)
+        count = self._tail - self._head
+        start = self._head % self._capacity
+        first = min(self._capacity - start, count)
+        new_buffer[:first] = self._buffer[start:start + first]
+        new_buffer[first:count] = self._buffer[: count - first]
+        self._buffer = new_buffer
+        self._capacity *= 2
+        self._head = 0
+        self._tail = count
 
     def add_request(self, timestamp: float) -> None:
         """Record a new request at the given timestamp."""
-        self.timestamps.append(timestamp)
+        if self.max_entries is not None:
+            if self.max_entries == 0:
+                return  # Zero-capacity window records nothing
+            if self._tail - self._head >= self.max_entries:
+                # At capacity: drop the oldest live entry (same
+                # implicit eviction a maxlen-bounded deque would do)
+                self._head += 1
+        elif self._tail - self._head >= self._capacity:
+            self._grow()
+        self._buffer[self._tail % self._capacity] = timestamp
+        self._tail += 1
 
     def clean_expired(self, window_start: float) -> int:
         """
         Remove requests older than window_start.
         Returns: number of requests removed.
-        """
-        initial_count = len(self.timestamps)
-        # Keep only timestamps >= window_start
-        self.timestamps = [ts for ts in self.timestamps if ts >= window_start]
-        return initial_count - len(self.timestamps)
 
-    def get_current_count(self, window_start: float) -> int:
+        The count is a free by-product of the binary search (it IS the
+        head advance), so returning it costs nothing on the hot path.
+        """
+        count = self._tail - self._head
+        if count == 0:
+            return 0
+
+        # Live entries occupy up to two contiguous, individually sorted
+        # slices of the ring; binary-search the first, and only touch
+        # the wrapped slice if the whole first slice is expired.
+        start = self._head % self._capacity
+        first_len = min(self._capacity - start, count)
+        removed = int(np.searchsorted(
+            self._buffer[start:start + first_len], window_start, side="left"
+        ))
+        if removed == first_len and count > first_len:
+            removed += int(np.searchsorted(
+                self._buffer[: count - first_len], window_start, side="left"
+            ))
+        self._head += removed
+        return removed
+
+    def remove_newest(self) -> None:
+        """Drop the most recently added timestamp, if any."""
+        if self._tail > self._head:
+            self._tail -= 1
+
+    def oldest(self) -> Optional[float]:
+        """Return the oldest live timestamp, or None if empty."""
+        if self._head < self._tail:
+            return self._buffer[self._head % self._capacity]
+        return None
+
+    def get_current_count(self, window_start: float = 0.0) -> int:
         """
         Return count of requests in current window.
         Assumes clean_expired was called first.
+
+        window_start is unused (expiry already advanced the head) and
+        kept only for callers of the old signature; hot paths inline
+        the tail - head subtraction instead of calling this.
         """
-        return len(self.timestamps)
+        return self._tail - self._head
 
     def is_empty(self) -> bool:
         """Check if no requests recorded."""
-        return len(self.timestamps) == 0
+        return self._tail == self._head
+
+
+class SlidingWindowCounter:
+    """
+    Approximate sliding window from two fixed-window counters.
+
+    Keeps only the previous and current fixed-window counts; the sliding
+    estimate weights the previous window by its un-elapsed fraction.
+    Memory is O(1) per key (two ints) versus O(max_requests) timestamps
+    for the log, at the cost of <~1% admission error for steady traffic.
+    """
+
+    def __init__(self, window_seconds: int):
+        self.window_seconds = window_seconds
+        self.prev_count = 0
+        self.curr_count = 0
+        self.curr_window = 0  # Fixed-window index of curr_count
+        # Guards the counters, mirroring SlidingWindowEntry.lock
+        self.lock = Lock()
+        # See SlidingWindowEntry.last_access
+        self.last_access = 0.0
+
+    def estimate(self, now: float) -> float:
+        """
+        Estimated request count in the window ending at `now`.
+
+        Rolls the counters forward if `now` has entered a new fixed
+        window. Must be called with the lock held.
+        """
+        window_idx = int(now // self.window_seconds)
+        if window_idx != self.curr_window:
+            # Shift: the old current window becomes "previous" only if
+            # it is actually adjacent; after a longer gap both are stale
+            if window_idx == self.curr_window + 1:
+                self.prev_count = self.curr_count
+            else:
+                self.prev_count = 0
+            self.curr_count = 0
+            self.curr_window = window_idx
+
+        fraction = (now % self.window_seconds) / self.window_seconds
+        return self.prev_count * (1.0 - fraction) + self.curr_count
+
+    def record(self) -> None:
+        """Count a request in the current fixed window."""
+        self.curr_count += 1
+
+    def unrecord(self) -> None:
+        """Undo one record(); tolerates a window roll in between."""
+        if self.curr_count > 0:
+            self.curr_count -= 1
+        elif self.prev_count > 0:
+            self.prev_count -= 1
+
+    def is_empty(self) -> bool:
+        """Check if no requests counted in either window."""
+        return self.prev_count == 0 and self.curr_count == 0
 
 
 class RateLimiter:
     """
     Thread-safe, in-memory Sliding Window Log rate limiter for AI inference.
 
+    Timestamps come from time.monotonic(), so window arithmetic is
+    immune to NTP slews and wall-clock jumps (a backwards jump with
+    time.time() would leave entries "in the future" that never expire).
+    Stored timestamps are therefore not wall-clock times.
+
     Example usage:
         limiter = RateLimiter(max_requests=100, window_seconds=3600)
 
@@ -66,43 +212,155 @@ class RateLimiter:
             pass
     """
 
-    def __init__(self, max_requests: int = 100, window_seconds: int = 3600):
+    # Lock stripes for the window dict; power of two so shard selection
+    # is `hash(key) & (n - 1)`
+    _NUM_SHARDS = 64
+
+    def __init__(
+        self,
+        max_requests: int = 100,
+        window_seconds: int = 3600,
+        algorithm: str = "log",
+        gc_idle_keys: bool = False,
+    ):
         """
         Initialize the rate limiter.
 
         Args:
             max_requests: Maximum requests allowed per window (default 100)
             window_seconds: Time window in seconds (default 3600 = 1 hour)
+            algorithm: "log" (exact; stores every timestamp, up to
+                max_requests floats per key) or "counter" (approximate
+                two-counter sliding window; O(1) memory per key, <~1%
+                admission error -- the right choice for large limits)
+            gc_idle_keys: If True, run a daemon sweeper thread that
+                evicts windows untouched for a full window and holding
+                no live timestamps. Keeps memory bounded under tenant
+                churn (ephemeral API keys create entries that would
+                otherwise live forever). Off by default.
         """
+        if algorithm not in ("log", "counter"):
+            raise ValueError(f"Unknown algorithm: {algorithm!r}")
+
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-
-        # Storage: key -> SlidingWindowEntry
-        self._windows: Dict[str, SlidingWindowEntry] = {}
-
-        self._locks: Dict[str, Lock] = defaultdict(Lock)
-
-        # Global lock for accessing _windows dict structure
-        self._dict_lock = Lock()
-
-        # Metrics
+        self.algorithm = algorithm
+
+        # Storage: the window dict is lock-striped into _NUM_SHARDS
+        # shards of (dict, Lock), selected by key hash. Entry creation
+        # only takes its shard's lock, so concurrent misses on different
+        # keys no longer serialize on one global dict lock; each entry
+        # still carries its own lock for the timestamp data.
+        self._shards = [
+            ({}, Lock()) for _ in range(self._NUM_SHARDS)
+        ]
+
+        # Inverted index: user_id -> set of window keys, maintained on
+        # window creation/deletion so reset_user(user_id) is O(keys for
+        # that user) instead of a scan of every shard. Guarded by its
+        # own lock since it spans shards.
+        self._user_keys: Dict[str, set] = defaultdict(set)
+        self._index_lock = Lock()
+
+        # Metrics. Incremented with plain += on the hot path: the
+        # updates happen under the per-key lock and int += is a handful
+        # of GIL-protected bytecodes, so at worst a rare cross-key race
+        # drops a single count -- fine for monitoring data, and it
+        # removes a global lock that serialized all keys on every call.
+        # _metrics_lock still guards read/reset for consistent snapshots.
         self._allowed_count = 0
         self._denied_count = 0
         self._metrics_lock = Lock()
 
-    def _get_key(self, user_id: str, model_id: str) -> str:
-        """Generate cache key for user-model pair."""
-        return f"{user_id}:{model_id}"
+        # Optional background GC: without it, a key inserted once and
+        # never hit again keeps its (empty) entry alive forever.
+        self.gc_idle_keys = gc_idle_keys
+        if gc_idle_keys:
+            sweeper = Thread(target=self._sweep_loop, daemon=True)
+            sweeper.start()
+
+    def _get_key(self, user_id: str, model_id: str) -> Tuple[str, str]:
+        """
+        Generate cache key for user-model pair.
+
+        A tuple instead of f"{user_id}:{model_id}": no string allocation
+        or formatting per call (element hashes are cached on the interned
+        strings), and no ambiguity when a user_id itself contains ':'.
+        This also makes an lru_cache over the key redundant -- caching
+        would trade the tiny tuple build for a cache lookup of the same
+        cost plus eviction bookkeeping.
+        """
+        return (user_id, model_id)
+
+    def _shard_for(self, key: Tuple[str, str]) -> tuple:
+        """Return the (windows dict, lock) shard owning this key."""
+        return self._shards[hash(key) & (self._NUM_SHARDS - 1)]
 
-    def _get_or_create_window(self, key: str) -> SlidingWindowEntry:
+    def _get_or_create_window(self, key: Tuple[str, str]) -> SlidingWindowEntry:
         """
         Get or create a SlidingWindowEntry for the given key.
 
-        Must be called while holding either dict_lock or specific key lock.
+        Takes only the owning shard's lock, so creation of unrelated
+        keys proceeds in parallel.
+        """
+        windows, shard_lock = self._shard_for(key)
+        with shard_lock:
+            entry = windows.get(key)
+            if entry is None:
+                if self.algorithm == "counter":
+                    entry = SlidingWindowCounter(self.window_seconds)
+                else:
+                    entry = SlidingWindowEntry(
+                        self.window_seconds, max_entries=self.max_requests
+                    )
+                windows[key] = entry
+                with self._index_lock:
+                    self._user_keys[key[0]].add(key)
+        return entry
+
+    def _sweep_loop(self) -> None:
+        """Periodically evict idle keys (runs in a daemon thread)."""
+        interval = self.window_seconds / 4
+        while True:
+            time.sleep(interval)
+            self._sweep_idle_keys()
+
+    def _sweep_idle_keys(self) -> None:
         """
-        if key not in self._windows:
-            self._windows[key] = SlidingWindowEntry(self.window_seconds)
-        return self._windows[key]
+        One GC pass: delete entries that are empty after expiry and
+        were last touched more than a full window ago.
+
+        Only idle entries are candidates, so a concurrent allow() on a
+        live key never races with its eviction; the worst case is an
+        entry deleted just as a request arrives, which simply recreates
+        it. Shards are swept one at a time to keep lock hold short.
+        """
+        now = time.monotonic()
+        idle_cutoff = now - self.window_seconds
+        window_start = now - self.window_seconds
+        for windows, shard_lock in self._shards:
+            with shard_lock:
+                stale = []
+                for key, entry in windows.items():
+                    if entry.last_access >= idle_cutoff:
+                        continue
+                    with entry.lock:
+                        if self.algorithm == "counter":
+                            entry.estimate(now)  # Roll stale windows off
+                        else:
+                            entry.clean_expired(window_start)
+                        if entry.is_empty():
+                            stale.append(key)
+                for key in stale:
+                    del windows[key]
+            if stale:
+                with self._index_lock:
+                    for key in stale:
+                        user_keys = self._user_keys.get(key[0])
+                        if user_keys is not None:
+                            user_keys.discard(key)
+                            if not user_keys:
+                                del self._user_keys[key[0]]
 
     def allow(self, user_id: str, model_id: str) -> bool:
         """
@@ -116,34 +374,154 @@ class RateLimiter:
             True if request is allowed, False if rate limit exceeded
         """
         key = self._get_key(user_id, model_id)
-        now = time.time()
+        now = time.monotonic()
         window_start = now - self.window_seconds
 
-        # Acquire per-key lock for thread safety
-        with self._locks[key]:
-            # Get or create the window entry
-            with self._dict_lock:
-                window_entry = self._get_or_create_window(key)
+        # Hoist per-call attribute reads into locals: each self.X inside
+        # the critical section is an interpreter-speed dict lookup, and
+        # the body is otherwise just compares and an append, so the
+        # lookups are a real fraction of the per-call cost.
+        max_requests = self.max_requests
+
+        # Fast path for the steady state: dict reads are atomic under
+        # the GIL, so an existing entry is fetched without any lock at
+        # all. Only a miss pays for (just) the owning shard's lock.
+        window_entry = self._shard_for(key)[0].get(key)
+        if window_entry is None:
+            window_entry = self._get_or_create_window(key)
+
+        # Plain attribute store is atomic under the GIL; the sweeper
+        # only needs a roughly current value.
+        window_entry.last_access = now
+
+        if self.algorithm == "counter":
+            with window_entry.lock:
+                if window_entry.estimate(now) < max_requests:
+                    window_entry.record()
+                    self._allowed_count += 1
+                    return True
+                else:
+                    self._denied_count += 1
+                    return False
+
+        # Acquire the entry's lock for thread safety
+        with window_entry.lock:
+            # Fast path: even counting any stale entries we are below
+            # the cap, so the request is trivially allowed -- no need to
+            # expire anything first. The count is inlined (tail - head)
+            # to skip a Python-level method call per admission.
+            if window_entry._tail - window_entry._head < max_requests:
+                window_entry.add_request(now)
+                self._allowed_count += 1
+                return True
 
-            # Clean expired requests (older than window_start)
-            window_entry.clean_expired(window_start)
+            # At the cap: the entry is bounded at max_requests, so if
+            # the oldest entry has expired, this append admits the
+            # request and implicitly evicts that entry in one O(1) step.
+            # If the oldest entry is still live, the window really is
+            # full and the request is denied.
+            oldest = window_entry.oldest()
+            if oldest is not None and oldest < window_start:
+                window_entry.add_request(now)
+                self._allowed_count += 1
+                return True
+            else:
+                self._denied_count += 1
+                return False
 
-            # Get current request count
-            current_count = window_entry.get_current_count(window_start)
+    def allow_many(
+        self, requests: List[Tuple[str, str]]
+    ) -> List[bool]:
+        """
+        Check a batch of (user_id, model_id) requests in one pass.
 
-            # Check limit and record if allowed
-            if current_count < self.max_requests:
-                window_entry.add_request(now)
+        Reads the clock once for the whole batch and groups requests by
+        key, so each key's lock is taken once and its window expired
+        once no matter how many batch entries hit it -- on a batch of K
+        same-key requests the lock traffic drops from K acquisitions to
+        one. Useful for servers that fan out many admissions per tick.
 
-                with self._metrics_lock:
-                    self._allowed_count += 1
+        Args:
+            requests: List of (user_id, model_id) pairs
 
-                return True
-            else:
-                with self._metrics_lock:
-                    self._denied_count += 1
+        Returns:
+            List of booleans in input order; True where allowed
+        """
+        now = time.monotonic()
+        window_start = now - self.window_seconds
+        max_requests = self.max_requests
+
+        keys = [self._get_key(u, m) for u, m in requests]
+        # Sort indices (not requests) so results keep input order
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        results = [False] * len(keys)
+        allowed_total = 0
+
+        i = 0
+        n = len(order)
+        while i < n:
+            key = keys[order[i]]
+            j = i
+            while j < n and keys[order[j]] == key:
+                j += 1
+
+            window_entry = self._shard_for(key)[0].get(key)
+            if window_entry is None:
+                window_entry = self._get_or_create_window(key)
+            window_entry.last_access = now
+
+            with window_entry.lock:
+                if self.algorithm == "counter":
+                    # estimate() rolls the windows once; each record()
+                    # then adds exactly 1 to the running estimate
+                    estimate = window_entry.estimate(now)
+                    for idx in order[i:j]:
+                        if estimate < max_requests:
+                            window_entry.record()
+                            estimate += 1
+                            results[idx] = True
+                            allowed_total += 1
+                else:
+                    window_entry.clean_expired(window_start)
+                    count = window_entry._tail - window_entry._head
+                    for idx in order[i:j]:
+                        if count < max_requests:
+                            window_entry.add_request(now)
+                            count += 1
+                            results[idx] = True
+                            allowed_total += 1
+            i = j
+
+        self._allowed_count += allowed_total
+        self._denied_count += len(keys) - allowed_total
+        return results
+
+    def refund(self, user_id: str, model_id: str) -> None:
+        """
+        Return the most recently consumed slot for a user-model pair.
 
-                return False
+        Completes the two-phase protocol for layered checks: allow()
+        already has try semantics (it either commits a slot or denies),
+        so a caller stacking several limiters can refund the ones that
+        passed when a later layer denies, instead of silently burning a
+        slot on a request that was never served.
+
+        Args:
+            user_id: Unique identifier for the user/tenant
+            model_id: Unique identifier for the model
+        """
+        key = self._get_key(user_id, model_id)
+        window_entry = self._shard_for(key)[0].get(key)
+        if window_entry is None:
+            return
+
+        with window_entry.lock:
+            if self.algorithm == "counter":
+                window_entry.unrecord()
+            else:
+                window_entry.remove_newest()
+        if self._allowed_count > 0:
+            self._allowed_count -= 1
 
     def get_request_count(self, user_id: str, model_id: str) -> int:
         """
@@ -159,15 +537,21 @@ class RateLimiter:
             Number of requests within the current window
         """
         key = self._get_key(user_id, model_id)
-        now = time.time()
+        now = time.monotonic()
         window_start = now - self.window_seconds
 
-        with self._locks[key]:
-            with self._dict_lock:
-                if key not in self._windows:
-                    return 0
-                window_entry = self._windows[key]
+        # Same lockless fast path as allow(): reading the shard dict is
+        # atomic under the GIL, and a missing key simply means no
+        # requests recorded.
+        window_entry = self._shard_for(key)[0].get(key)
+        if window_entry is None:
+            return 0
 
+        if self.algorithm == "counter":
+            with window_entry.lock:
+                return int(window_entry.estimate(now))
+
+        with window_entry.lock:
             window_entry.clean_expired(window_start)
             return window_entry.get_current_count(window_start)
 
@@ -182,21 +566,25 @@ class RateLimiter:
         """
         if model_id:
             key = self._get_key(user_id, model_id)
-            with self._locks[key]:
-                with self._dict_lock:
-                    if key in self._windows:
-                        del self._windows[key]
+            windows, shard_lock = self._shard_for(key)
+            with shard_lock:
+                removed = windows.pop(key, None)
+            if removed is not None:
+                with self._index_lock:
+                    user_keys = self._user_keys.get(user_id)
+                    if user_keys is not None:
+                        user_keys.discard(key)
+                        if not user_keys:
+                            del self._user_keys[user_id]
         else:
-            # Reset all models for user
-            with self._dict_lock:
-                keys_to_remove = [
-                    k
-                    for k in self._windows.keys()
-                    if k.startswith(f"{user_id}:")
-                ]
-                for key in keys_to_remove:
-                    with self._locks[key]:
-                        del self._windows[key]
+            # Reset all models for user via the inverted index -- O(k)
+            # in the user's keys rather than a scan of every shard
+            with self._index_lock:
+                keys = self._user_keys.pop(user_id, ())
+            for key in keys:
+                windows, shard_lock = self._shard_for(key)
+                with shard_lock:
+                    windows.pop(key, None)
 
     def get_metrics(self) -> Dict:
         """
@@ -214,7 +602,7 @@ class RateLimiter:
             "denied_count": self._denied_count,
             "total_requests": self._allowed_count + self._denied_count,
             "deny_rate_percent": deny_rate,
-            "active_keys": len(self._windows),
+            "active_keys": sum(len(windows) for windows, _ in self._shards),
         }
 
     def reset_metrics(self) -> None:
@@ -233,6 +621,12 @@ class MultiTierRateLimiter:
     2. Per model globally (e.g., all users on "gpt-4")
     3. Per model tier (e.g., high-cost models vs low-cost)
 
+    Each level is a flat dict of SlidingWindowCounter rather than a
+    full RateLimiter: the model and tier levels aggregate all users
+    into one counter anyway, so a decision is three dict lookups and
+    three integer compares instead of three full limiter calls with
+    their own key plumbing and timestamp buffers.
+
     Example:
         limiter = MultiTierRateLimiter(
             per_user_model=RateLimitConfig(100, 3600),
@@ -262,18 +656,15 @@ class MultiTierRateLimiter:
         self.per_model = per_model or RateLimitConfig(10000, 3600)
         self.per_tier = per_tier or {}
 
-        self.user_model_limiter = RateLimiter(
-            self.per_user_model.max_requests,
-            self.per_user_model.window_seconds,
-        )
-        self.model_limiter = RateLimiter(
-            self.per_model.max_requests, self.per_model.window_seconds
-        )
-        self.tier_limiters: Dict[str, RateLimiter] = {}
-        for tier, config in self.per_tier.items():
-            self.tier_limiters[tier] = RateLimiter(
-                config.max_requests, config.window_seconds
-            )
+        # One approximate sliding-window counter per key at each level;
+        # counters carry their own locks (see SlidingWindowCounter)
+        self._user_model_counters: Dict[
+            Tuple[str, str], SlidingWindowCounter
+        ] = {}
+        self._model_counters: Dict[str, SlidingWindowCounter] = {}
+        self._tier_counters: Dict[str, SlidingWindowCounter] = {}
+        # Guards counter creation across all three dicts
+        self._create_lock = Lock()
 
     def get_model_tier(self, model_id: str) -> str:
         """
@@ -292,6 +683,18 @@ class MultiTierRateLimiter:
         }
         return tier_map.get(model_id, "standard")
 
+    def _get_counter(
+        self, counters: Dict, key, config: RateLimitConfig
+    ) -> SlidingWindowCounter:
+        """Get or create the counter for key in one of the level dicts."""
+        counter = counters.get(key)
+        if counter is None:
+            with self._create_lock:
+                counter = counters.setdefault(
+                    key, SlidingWindowCounter(config.window_seconds)
+                )
+        return counter
+
     def allow(self, user_id: str, model_id: str) -> Tuple[bool, str]:
         """
         Check if request is allowed across all tiers.
@@ -299,21 +702,57 @@ class MultiTierRateLimiter:
         Returns:
             (allowed: bool, reason: str)
             If denied, reason explains which tier rejected it.
-        """
-        # Check per-user-model limit
-        if not self.user_model_limiter.allow(user_id, model_id):
-            return False, f"User {user_id} exceeded limit for model {model_id}"
-
-        # Check per-model global limit
-        if not self.model_limiter.allow("__global__", model_id):
-            return False, f"Global limit exceeded for model {model_id}"
 
-        # Check per-tier limit if applicable
+        Two-phase: every level is checked before any level records, so
+        a deny at one level never consumes quota at another -- a
+        rejected request must not burn the user's per-user-model slot.
+        """
+        now = time.monotonic()
+
+        checks = [
+            (
+                self._get_counter(
+                    self._user_model_counters,
+                    (user_id, model_id),
+                    self.per_user_model,
+                ),
+                self.per_user_model.max_requests,
+                f"User {user_id} exceeded limit for model {model_id}",
+            ),
+            (
+                self._get_counter(
+                    self._model_counters, model_id, self.per_model
+                ),
+                self.per_model.max_requests,
+                f"Global limit exceeded for model {model_id}",
+            ),
+        ]
         tier = self.get_model_tier(model_id)
-        if tier in self.tier_limiters:
-            if not self.tier_limiters[tier].allow(
-                "__global__", f"tier-{tier}"
-            ):
-                return False, f"Tier {tier} global limit exceeded"
+        tier_config = self.per_tier.get(tier)
+        if tier_config is not None:
+            checks.append(
+                (
+                    self._get_counter(
+                        self._tier_counters, tier, tier_config
+                    ),
+                    tier_config.max_requests,
+                    f"Tier {tier} global limit exceeded",
+                )
+            )
 
-        return True, "Allowed"
+        # Hold all the counters' locks at once so check-then-record is
+        # atomic across levels; a canonical (id) acquisition order keeps
+        # concurrent calls on overlapping counters deadlock-free.
+        locks = sorted({c[0].lock for c in checks}, key=id)
+        for lock in locks:
+            lock.acquire()
+        try:
+            for counter, max_requests, reason in checks:
+                if counter.estimate(now) >= max_requests:
+                    return False, reason
+            for counter, _, _ in checks:
+                counter.record()
+            return True, "Allowed"
+        finally:
+            for lock in reversed(locks):
+                lock.release()
@@ -9,6 +9,7 @@ from typing import List
 from rate_limiter import (
     RateLimiter,
     SlidingWindowEntry,
+    SlidingWindowCounter,
     RateLimitConfig,
     MultiTierRateLimiter,
 )
@@ -355,6 +356,23 @@ class TestMultiTierRateLimiter:
         # Third request denied by global limit
         assert limiter.allow("user3", "gpt-4")[0] is False
 
+    def test_deny_does_not_consume_other_levels(self):
+        """Test that a deny at one level leaves other levels untouched."""
+        user_config = RateLimitConfig(max_requests=100, window_seconds=3600)
+        model_config = RateLimitConfig(max_requests=1, window_seconds=3600)
+
+        limiter = MultiTierRateLimiter(
+            per_user_model=user_config, per_model=model_config
+        )
+
+        assert limiter.allow("user1", "gpt-4")[0] is True
+        assert limiter.allow("user2", "gpt-4")[0] is False
+
+        # The global-model deny must not have recorded against user2's
+        # per-user-model counter (check-all-then-commit)
+        counter = limiter._user_model_counters[("user2", "gpt-4")]
+        assert counter.curr_count == 0
+
 
 class TestEdgeCases:
     """Tests for edge cases and boundary conditions."""
@@ -455,3 +473,320 @@ class TestMetrics:
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
+
+
+class TestSlidingWindowCounter:
+    """Tests for the two-window approximate counter."""
+
+    def test_estimate_within_single_window(self):
+        """Test that the estimate is exact inside one fixed window."""
+        counter = SlidingWindowCounter(window_seconds=100)
+        now = 150.0  # Mid-window; prev window is empty
+
+        assert counter.estimate(now) == 0
+        counter.record()
+        counter.record()
+        assert counter.estimate(now) == 2
+
+    def test_estimate_weights_previous_window(self):
+        """Test that the previous window decays across the boundary."""
+        counter = SlidingWindowCounter(window_seconds=100)
+
+        counter.estimate(150.0)
+        for _ in range(4):
+            counter.record()
+
+        # 25% into the next window: 4 * 0.75 + 0 = 3
+        assert counter.estimate(225.0) == pytest.approx(3.0)
+
+        # 75% into the next window: 4 * 0.25 + 0 = 1
+        assert counter.estimate(275.0) == pytest.approx(1.0)
+
+    def test_gap_resets_both_windows(self):
+        """Test that a multi-window gap discards stale counts."""
+        counter = SlidingWindowCounter(window_seconds=100)
+
+        counter.estimate(150.0)
+        counter.record()
+
+        # Two windows later, nothing should carry over
+        assert counter.estimate(450.0) == 0
+
+    def test_unrecord(self):
+        """Test that unrecord undoes a record."""
+        counter = SlidingWindowCounter(window_seconds=100)
+
+        counter.estimate(150.0)
+        counter.record()
+        counter.unrecord()
+        assert counter.estimate(150.0) == 0
+        assert counter.is_empty()
+
+        # Tolerates a window roll between record and unrecord
+        counter.record()
+        counter.estimate(250.0)  # Rolls: count moves to prev window
+        counter.unrecord()
+        assert counter.estimate(250.0) == 0
+
+    def test_is_empty(self):
+        """Test empty detection across window rolls."""
+        counter = SlidingWindowCounter(window_seconds=100)
+
+        assert counter.is_empty()
+        counter.estimate(150.0)
+        counter.record()
+        assert not counter.is_empty()
+
+
+class TestCounterAlgorithm:
+    """Tests for RateLimiter with algorithm="counter"."""
+
+    def test_allow_and_deny(self):
+        """Test basic admission with the counter algorithm."""
+        limiter = RateLimiter(
+            max_requests=3, window_seconds=3600, algorithm="counter"
+        )
+
+        assert limiter.allow("user1", "model-a") is True
+        assert limiter.allow("user1", "model-a") is True
+        assert limiter.allow("user1", "model-a") is True
+        assert limiter.allow("user1", "model-a") is False
+
+    def test_request_count(self):
+        """Test request counting with the counter algorithm."""
+        limiter = RateLimiter(
+            max_requests=10, window_seconds=3600, algorithm="counter"
+        )
+
+        assert limiter.get_request_count("user1", "model-a") == 0
+        limiter.allow("user1", "model-a")
+        limiter.allow("user1", "model-a")
+        assert limiter.get_request_count("user1", "model-a") == 2
+
+    def test_metrics(self):
+        """Test that counter denials feed the metrics."""
+        limiter = RateLimiter(
+            max_requests=1, window_seconds=3600, algorithm="counter"
+        )
+
+        limiter.allow("user1", "model-a")
+        limiter.allow("user1", "model-a")  # Denied
+
+        metrics = limiter.get_metrics()
+        assert metrics["allowed_count"] == 1
+        assert metrics["denied_count"] == 1
+
+    def test_reset_user(self):
+        """Test that reset clears counter state."""
+        limiter = RateLimiter(
+            max_requests=1, window_seconds=3600, algorithm="counter"
+        )
+
+        limiter.allow("user1", "model-a")
+        assert limiter.allow("user1", "model-a") is False
+
+        limiter.reset_user("user1", "model-a")
+        assert limiter.allow("user1", "model-a") is True
+
+    def test_unknown_algorithm_rejected(self):
+        """Test that an unknown algorithm name raises."""
+        with pytest.raises(ValueError):
+            RateLimiter(algorithm="leaky_bucket")
+
+
+class TestAllowMany:
+    """Tests for the batch allow_many API."""
+
+    def test_batch_within_limit(self):
+        """Test that a batch under the limit is fully allowed."""
+        limiter = RateLimiter(max_requests=5, window_seconds=3600)
+
+        results = limiter.allow_many(
+            [("user1", "model-a"), ("user2", "model-a")]
+        )
+        assert results == [True, True]
+
+    def test_batch_enforces_per_key_limit(self):
+        """Test that same-key requests in one batch share the cap."""
+        limiter = RateLimiter(max_requests=2, window_seconds=3600)
+
+        # Results must come back in input order, not grouped order
+        results = limiter.allow_many(
+            [
+                ("user1", "model-a"),
+                ("user2", "model-a"),
+                ("user1", "model-a"),
+                ("user1", "model-a"),
+            ]
+        )
+        assert results == [True, True, True, False]
+
+    def test_batch_counts_against_later_calls(self):
+        """Test that batch admissions consume the same quota as allow."""
+        limiter = RateLimiter(max_requests=2, window_seconds=3600)
+
+        limiter.allow_many([("user1", "model-a"), ("user1", "model-a")])
+        assert limiter.allow("user1", "model-a") is False
+        assert limiter.get_request_count("user1", "model-a") == 2
+
+    def test_batch_metrics(self):
+        """Test that batch results feed the metrics."""
+        limiter = RateLimiter(max_requests=1, window_seconds=3600)
+
+        limiter.allow_many([("user1", "model-a"), ("user1", "model-a")])
+
+        metrics = limiter.get_metrics()
+        assert metrics["allowed_count"] == 1
+        assert metrics["denied_count"] == 1
+
+    def test_batch_counter_algorithm(self):
+        """Test allow_many with the counter algorithm."""
+        limiter = RateLimiter(
+            max_requests=2, window_seconds=3600, algorithm="counter"
+        )
+
+        results = limiter.allow_many([("user1", "model-a")] * 3)
+        assert results == [True, True, False]
+
+    def test_empty_batch(self):
+        """Test that an empty batch is a no-op."""
+        limiter = RateLimiter(max_requests=5, window_seconds=3600)
+
+        assert limiter.allow_many([]) == []
+        assert limiter.get_metrics()["total_requests"] == 0
+
+
+class TestRefund:
+    """Tests for the refund slot-return API."""
+
+    def test_refund_returns_a_slot(self):
+        """Test that refund frees the most recent slot."""
+        limiter = RateLimiter(max_requests=2, window_seconds=3600)
+
+        limiter.allow("user1", "model-a")
+        limiter.allow("user1", "model-a")
+        assert limiter.allow("user1", "model-a") is False
+
+        limiter.refund("user1", "model-a")
+        assert limiter.get_request_count("user1", "model-a") == 1
+        assert limiter.allow("user1", "model-a") is True
+
+    def test_refund_rolls_back_metrics(self):
+        """Test that refund undoes the allowed count."""
+        limiter = RateLimiter(max_requests=2, window_seconds=3600)
+
+        limiter.allow("user1", "model-a")
+        limiter.refund("user1", "model-a")
+
+        assert limiter.get_metrics()["allowed_count"] == 0
+
+    def test_refund_unknown_key_is_noop(self):
+        """Test that refunding a never-seen key does nothing."""
+        limiter = RateLimiter(max_requests=2, window_seconds=3600)
+
+        limiter.refund("ghost", "model-a")
+        assert limiter.get_metrics()["allowed_count"] == 0
+
+    def test_refund_counter_algorithm(self):
+        """Test refund with the counter algorithm."""
+        limiter = RateLimiter(
+            max_requests=1, window_seconds=3600, algorithm="counter"
+        )
+
+        limiter.allow("user1", "model-a")
+        assert limiter.allow("user1", "model-a") is False
+
+        limiter.refund("user1", "model-a")
+        assert limiter.allow("user1", "model-a") is True
+
+
+class TestIdleSweeper:
+    """Tests for the optional idle-key GC."""
+
+    def test_sweep_evicts_idle_empty_keys(self):
+        """Test that an expired, untouched key is evicted."""
+        limiter = RateLimiter(max_requests=5, window_seconds=0.05)
+
+        limiter.allow("user1", "model-a")
+        assert limiter.get_metrics()["active_keys"] == 1
+
+        time.sleep(0.12)  # Idle for more than a full window
+        limiter._sweep_idle_keys()
+
+        assert limiter.get_metrics()["active_keys"] == 0
+        # Key works again after eviction (entry is simply recreated)
+        assert limiter.allow("user1", "model-a") is True
+
+    def test_sweep_keeps_recently_active_keys(self):
+        """Test that a recently hit key survives a sweep."""
+        limiter = RateLimiter(max_requests=5, window_seconds=3600)
+
+        limiter.allow("user1", "model-a")
+        limiter._sweep_idle_keys()
+
+        assert limiter.get_metrics()["active_keys"] == 1
+        assert limiter.get_request_count("user1", "model-a") == 1
+
+    def test_sweep_cleans_user_index(self):
+        """Test that eviction also drops the user from the index."""
+        limiter = RateLimiter(max_requests=5, window_seconds=0.05)
+
+        limiter.allow("user1", "model-a")
+        time.sleep(0.12)
+        limiter._sweep_idle_keys()
+
+        assert "user1" not in limiter._user_keys
+
+    def test_sweeper_thread_starts(self):
+        """Test that the gc_idle_keys flag is accepted and recorded."""
+        limiter = RateLimiter(
+            max_requests=5, window_seconds=0.05, gc_idle_keys=True
+        )
+
+        assert limiter.gc_idle_keys is True
+        assert limiter.allow("user1", "model-a") is True
+
+
+class TestTokenBucketLimiter:
+    """Tests for the token-budget limiter in examples.py."""
+
+    @pytest.fixture
+    def token_limiter_cls(self):
+        # examples.py imports fastapi at module level; skip where the
+        # optional dependency is absent
+        pytest.importorskip("fastapi")
+        from examples import TokenBucketLimiter
+
+        return TokenBucketLimiter
+
+    def test_allow_within_budget(self, token_limiter_cls):
+        """Test admission while the budget lasts."""
+        limiter = token_limiter_cls(max_tokens=1000, refill_seconds=3600)
+
+        assert limiter.allow("user1", "gpt-4", 300, 300) is True
+        assert limiter.allow("user1", "gpt-4", 200, 100) is True
+
+    def test_deny_over_budget(self, token_limiter_cls):
+        """Test that exceeding the budget is denied."""
+        limiter = token_limiter_cls(max_tokens=1000, refill_seconds=3600)
+
+        assert limiter.allow("user1", "gpt-4", 500, 400) is True
+        assert limiter.allow("user1", "gpt-4", 100, 100) is False
+
+    def test_budget_refills(self, token_limiter_cls):
+        """Test that the budget refills over time."""
+        limiter = token_limiter_cls(max_tokens=100, refill_seconds=0.05)
+
+        assert limiter.allow("user1", "gpt-4", 50, 50) is True
+        assert limiter.allow("user1", "gpt-4", 50, 50) is False
+
+        time.sleep(0.12)  # More than a full refill interval
+        assert limiter.allow("user1", "gpt-4", 50, 50) is True
+
+    def test_budgets_are_per_key(self, token_limiter_cls):
+        """Test that users do not share a budget."""
+        limiter = token_limiter_cls(max_tokens=100, refill_seconds=3600)
+
+        assert limiter.allow("user1", "gpt-4", 50, 50) is True
+        assert limiter.allow("user2", "gpt-4", 50, 50) is True
+        assert limiter.allow("user1", "gpt-4", 1, 0) is False